@@ -25,4 +25,7 @@ setup(
         'usda.management',
         'usda.management.commands',
     ],
+    package_data={
+        'usda': ['templates/usda/tests/*.html'],
+    },
 )
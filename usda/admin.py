@@ -1,22 +1,124 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList, MAX_SHOW_ALL_ALLOWED
+from django.core.paginator import InvalidPage, Paginator
+from django.db import connections
+from django.utils.translation import ugettext_lazy as _
 
 from usda.models import Food, FoodGroup, Weight, Nutrient, Footnote, \
                         DataSource, DataDerivation, Source, NutrientData
 
 
-class WeightAdmin(admin.ModelAdmin):
+# Tables estimated to hold fewer rows than this are counted exactly.
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+
+def estimated_count(queryset):
+    """
+    Returns the PostgreSQL planner's row estimate for an unfiltered queryset,
+    or None when the queryset is filtered, the database is not PostgreSQL or
+    the table is small enough to count exactly.
+    """
+    if not hasattr(queryset, 'query') or queryset.query.where:
+        return None
+    connection = connections[queryset.db]
+    if not connection.settings_dict['ENGINE'].endswith('postgresql_psycopg2'):
+        return None
+    cursor = connection.cursor()
+    cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s', [queryset.model._meta.db_table])
+    row = cursor.fetchone()
+    if row is None or row[0] < ESTIMATED_COUNT_THRESHOLD:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    A Paginator that uses `estimated_count` for unfiltered querysets instead
+    of running a `COUNT(*)` over the whole table.
+    """
+    def _get_count(self):
+        if self._count is None:
+            self._count = estimated_count(self.object_list)
+            if self._count is None:
+                return super(EstimatedCountPaginator, self)._get_count()
+        return self._count
+    count = property(_get_count)
+
+
+class EstimatedCountChangeList(ChangeList):
+    """
+    A ChangeList that paginates with `EstimatedCountPaginator` and estimates
+    the unfiltered total shown next to filtered results.
+    """
+    def get_results(self, request):
+        paginator = EstimatedCountPaginator(self.query_set, self.list_per_page)
+        # Get the number of objects, with admin filters applied.
+        result_count = paginator.count
+
+        # Get the total number of objects, with no admin filters applied.
+        if not self.query_set.query.where:
+            full_result_count = result_count
+        else:
+            full_result_count = estimated_count(self.root_query_set)
+            if full_result_count is None:
+                full_result_count = self.root_query_set.count()
+
+        can_show_all = result_count <= MAX_SHOW_ALL_ALLOWED
+        multi_page = result_count > self.list_per_page
+
+        # Get the list of objects to display on this page.
+        if (self.show_all and can_show_all) or not multi_page:
+            result_list = self.query_set._clone()
+        else:
+            try:
+                result_list = paginator.page(self.page_num+1).object_list
+            except InvalidPage:
+                result_list = ()
+
+        self.result_count = result_count
+        self.full_result_count = full_result_count
+        self.result_list = result_list
+        self.can_show_all = can_show_all
+        self.multi_page = multi_page
+        self.paginator = paginator
+
+
+class EstimatedCountAdmin(admin.ModelAdmin):
+    def get_changelist(self, request, **kwargs):
+        return EstimatedCountChangeList
+
+
+class FoodAdmin(EstimatedCountAdmin):
+    list_display = ('ndb_number', 'long_description', 'food_group')
+    list_filter = ('food_group', )
+
+
+class WeightAdmin(EstimatedCountAdmin):
+    list_display = ('food', 'sequence', 'amount', 'description', 'gram_weight')
+    list_select_related = True
     raw_id_fields = ('food', )
 
 
-class FootnoteAdmin(admin.ModelAdmin):
+class FootnoteAdmin(EstimatedCountAdmin):
+    list_display = ('food', 'number', 'type', 'nutrient_number', 'text')
+    list_select_related = True
     raw_id_fields = ('food', )
 
+    def nutrient_number(self, obj):
+        # `nutrient` is nullable, so select_related() does not follow it.
+        # Display the raw number rather than running a query per row.
+        return obj.nutrient_id
+    nutrient_number.short_description = _('Nutrient')
+
 
-class NutrientDataAdmin(admin.ModelAdmin):
+class NutrientDataAdmin(EstimatedCountAdmin):
+    list_display = ('food', 'nutrient', 'nutrient_value', 'data_points')
+    list_select_related = True
+    list_filter = ('nutrient', )
     raw_id_fields = ('food', 'nutrient', )
 
 
-admin.site.register(Food)
+admin.site.register(Food, FoodAdmin)
 admin.site.register(FoodGroup)
 admin.site.register(Weight, WeightAdmin)
 admin.site.register(Nutrient)
@@ -24,4 +126,4 @@ admin.site.register(Footnote, FootnoteAdmin)
 admin.site.register(DataSource)
 admin.site.register(DataDerivation)
 admin.site.register(Source)
-admin.site.register(NutrientData, NutrientDataAdmin)
\ No newline at end of file
+admin.site.register(NutrientData, NutrientDataAdmin)
@@ -0,0 +1,33 @@
+from django.db import connections
+
+
+def stream_query(using, sql, step=2000, name='usda_stream'):
+    """
+    Executes `sql` and yields its rows, fetching `step` rows at a time.
+
+    On PostgreSQL a named (server-side) cursor and on MySQL an unbuffered
+    `SSCursor` is used, so that the result set is never held in memory in
+    its entirety.  SQLite fetches rows as they are requested.  On MySQL no
+    other query can run on the connection until the rows are consumed.
+    """
+    connection = connections[using]
+    engine = connection.settings_dict['ENGINE']
+    if engine.endswith('postgresql_psycopg2'):
+        connection.cursor() # Ensure the connection is open
+        cursor = connection.connection.cursor(name)
+    elif engine.endswith('mysql'):
+        import MySQLdb.cursors
+        connection.cursor() # Ensure the connection is open
+        cursor = connection.connection.cursor(MySQLdb.cursors.SSCursor)
+    else:
+        cursor = connection.cursor()
+
+    try:
+        cursor.execute(sql)
+        rows = cursor.fetchmany(step)
+        while rows:
+            for row in rows:
+                yield row
+            rows = cursor.fetchmany(step)
+    finally:
+        cursor.close()
@@ -0,0 +1,162 @@
+"""
+Percent Daily Value calculations for foods and recipes.
+
+Reference intakes are the FDA Daily Values for nutrition labelling (21 CFR
+101.9, 2016 revision), keyed by SR nutrient number.
+"""
+from usda.models import Food, Nutrient, NutrientData
+
+
+PROFILE_ADULT = 'adult'
+PROFILE_CHILD = 'child'
+PROFILE_PREGNANT = 'pregnant'
+
+PROFILE_CHOICES = (
+    (PROFILE_ADULT, 'Adults and children 4 years and older'),
+    (PROFILE_CHILD, 'Children 1 through 3 years'),
+    (PROFILE_PREGNANT, 'Pregnant and lactating women'),
+)
+
+# Nutrient number: (units, adult, child, pregnant)
+REFERENCE_INTAKES = {
+    203: ('g', 50, 13, 71),         # Protein
+    204: ('g', 78, 39, 78),         # Total lipid (fat)
+    205: ('g', 275, 150, 275),      # Carbohydrate, by difference
+    291: ('g', 28, 14, 28),         # Fiber, total dietary
+    301: ('mg', 1300, 700, 1300),   # Calcium
+    303: ('mg', 18, 7, 27),         # Iron
+    304: ('mg', 420, 80, 400),      # Magnesium
+    305: ('mg', 1250, 460, 1250),   # Phosphorus
+    306: ('mg', 4700, 3000, 5100),  # Potassium
+    307: ('mg', 2300, 1500, 2300),  # Sodium
+    309: ('mg', 11, 3, 13),         # Zinc
+    312: ('mg', 0.9, 0.3, 1.3),     # Copper
+    315: ('mg', 2.3, 1.2, 2.6),     # Manganese
+    317: ('ug', 55, 20, 70),        # Selenium
+    320: ('ug', 900, 300, 1300),    # Vitamin A, RAE
+    323: ('mg', 15, 6, 19),         # Vitamin E (alpha-tocopherol)
+    328: ('ug', 20, 15, 15),        # Vitamin D (D2 + D3)
+    401: ('mg', 90, 15, 120),       # Vitamin C
+    404: ('mg', 1.2, 0.5, 1.4),     # Thiamin
+    405: ('mg', 1.3, 0.5, 1.6),     # Riboflavin
+    406: ('mg', 16, 6, 18),         # Niacin
+    410: ('mg', 5, 2, 7),           # Pantothenic acid
+    415: ('mg', 1.7, 0.5, 2.0),     # Vitamin B-6
+    418: ('ug', 2.4, 0.9, 2.8),     # Vitamin B-12
+    421: ('mg', 550, 200, 550),     # Choline, total
+    430: ('ug', 120, 30, 90),       # Vitamin K (phylloquinone)
+    435: ('ug', 400, 150, 600),     # Folate, DFE
+    601: ('mg', 300, 300, 300),     # Cholesterol
+    606: ('g', 20, 10, 20),         # Fatty acids, total saturated
+}
+
+# Grams per unit for the mass units used by SR.
+UNIT_GRAMS = {
+    'g': 1.0,
+    'mg': 1e-3,
+    'ug': 1e-6,
+    'mcg': 1e-6,
+    u'\xb5g': 1e-6,
+    u'\u03bcg': 1e-6,
+}
+
+_profile_cache = {}
+
+
+def convert(value, from_units, to_units):
+    """
+    Converts `value` between mass units. Raises ValueError for units that
+    cannot be converted, such as IU.
+    """
+    if from_units == to_units:
+        return value
+    try:
+        return value * UNIT_GRAMS[from_units] / UNIT_GRAMS[to_units]
+    except KeyError:
+        raise ValueError('Unable to convert from %s to %s' % (from_units, to_units))
+
+
+def daily_values(profile=PROFILE_ADULT, using=None):
+    """
+    Returns a dict mapping nutrient number to the Daily Value for `profile`,
+    expressed in the units the nutrient is stored in.
+
+    The result is computed once per profile and database and then cached for
+    the life of the process.  By default the database is chosen by the router.
+    Nothing is cached until the nutrients have been imported.
+    """
+    key = (profile, using)
+    if key not in _profile_cache:
+        try:
+            column = [choice[0] for choice in PROFILE_CHOICES].index(profile) + 1
+        except ValueError:
+            raise ValueError('Unknown profile %r' % profile)
+
+        values = {}
+        for number, units in Nutrient.objects.using(using).filter(
+            number__in=REFERENCE_INTAKES.keys()
+        ).values_list('number', 'units'):
+            reference = REFERENCE_INTAKES[number]
+            values[number] = convert(float(reference[column]), reference[0], units)
+        if not values:
+            return values
+        _profile_cache[key] = values
+    return _profile_cache[key]
+
+
+def clear_cache():
+    _profile_cache.clear()
+
+
+def percent_daily_values(items, profile=PROFILE_ADULT, nutrients=None, using=None):
+    """
+    Computes the percent Daily Value of every nutrient for many foods or
+    recipes at once.
+
+    Each item in `items` is either a food (a `Food` or an NDB number), taken
+    as a 100 gram portion, or a recipe given as a dict mapping foods to
+    grams. `nutrients` optionally restricts the result to a list of nutrient
+    numbers.
+
+    Returns a tuple of the nutrient numbers and a matrix with one row per item
+    and one column per nutrient number. All nutrient values are read in a
+    single query.
+    """
+    values = daily_values(profile, using)
+    if nutrients is None:
+        numbers = sorted(values.keys())
+    else:
+        numbers = [number for number in nutrients if number in values]
+    columns = dict([(number, i) for i, number in enumerate(numbers)])
+
+    recipes = []
+    for item in items:
+        if not isinstance(item, dict):
+            item = {item: 100.0}
+        recipes.append(dict([
+            (isinstance(food, Food) and food.pk or int(food), float(grams))
+            for food, grams in item.items()
+        ]))
+
+    ndb_numbers = set()
+    for recipe in recipes:
+        ndb_numbers.update(recipe.keys())
+
+    per_gram = {}
+    for food, nutrient, value in NutrientData.objects.using(using).filter(
+        food__in=ndb_numbers, nutrient__in=numbers
+    ).values_list('food', 'nutrient', 'nutrient_value'):
+        per_gram.setdefault(food, []).append((columns[nutrient], value / 100.0))
+
+    matrix = []
+    for recipe in recipes:
+        row = [0.0] * len(numbers)
+        for food, grams in recipe.items():
+            for column, value in per_gram.get(food, ()):
+                row[column] += value * grams
+        matrix.append([
+            amount * 100.0 / values[number]
+            for number, amount in zip(numbers, row)
+        ])
+
+    return numbers, matrix
@@ -0,0 +1,72 @@
+import logging
+
+from django.db import connections
+
+from usda.models import NutrientData
+
+
+# Indexes that Django does not create on its own.  Foreign keys such as
+# `Food.food_group`, `NutrientData.nutrient`, `Weight.food` and
+# `Footnote.nutrient` are already indexed by `syncdb`.
+#
+# Each entry is (index name, model, field names).
+INDEXES = (
+    ('usda_nutrientdata_nutrient_value', NutrientData, ('nutrient', 'nutrient_value')),
+)
+
+
+def _engine(connection):
+    return connection.settings_dict['ENGINE'].split('.')[-1]
+
+
+def index_exists(connection, name, table):
+    cursor = connection.cursor()
+    engine = _engine(connection)
+    if engine.startswith('postgresql'):
+        cursor.execute("SELECT 1 FROM pg_class WHERE relname = %s AND relkind = 'i'", [name])
+    elif engine == 'mysql':
+        cursor.execute('SELECT 1 FROM information_schema.statistics WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s', [table, name])
+    else:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = %s", [name])
+    return cursor.fetchone() is not None
+
+
+def create_indexes(using):
+    """
+    Creates any missing `INDEXES` on the `using` database.
+
+    Creating indexes once the tables have been populated is much faster than
+    maintaining them row by row during an import.
+    """
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    cursor = connection.cursor()
+    for name, model, field_names in INDEXES:
+        table = model._meta.db_table
+        if index_exists(connection, name, table):
+            continue
+        logging.info('Creating index %s...' % name)
+        cursor.execute('CREATE INDEX %s ON %s (%s)' % (
+            qn(name), qn(table),
+            ', '.join([qn(model._meta.get_field(field_name).column) for field_name in field_names])
+        ))
+
+
+def drop_indexes(using):
+    """
+    Drops any existing `INDEXES` from the `using` database.
+
+    Does nothing on MySQL, where `DROP INDEX` implicitly commits the open
+    transaction; the indexes are maintained during the load instead.
+    """
+    connection = connections[using]
+    if _engine(connection) == 'mysql':
+        return
+    qn = connection.ops.quote_name
+    cursor = connection.cursor()
+    for name, model, field_names in INDEXES:
+        table = model._meta.db_table
+        if not index_exists(connection, name, table):
+            continue
+        logging.info('Dropping index %s...' % name)
+        cursor.execute('DROP INDEX %s' % qn(name))
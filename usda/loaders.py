@@ -0,0 +1,146 @@
+import threading
+import time
+
+from usda.models import NutrientData
+
+
+# Seconds a food stays cached before it is fetched again.
+DEFAULT_TIMEOUT = 3600
+
+# Number of foods cached before expired entries are culled.
+DEFAULT_MAX_ENTRIES = 10000
+
+
+class NutrientLoader(object):
+    """
+    Loads nutrient values for many foods at once and keeps them in memory.
+
+    Concurrent callers asking for the same or overlapping foods share a single
+    query: a food that is already being fetched by another thread is waited
+    on rather than fetched again.  Each call to `load_many` runs one query for
+    the foods that are neither cached nor in flight, and another only for
+    foods it waited on that the other thread failed to load or that have
+    already expired.
+
+    Cached foods expire after `timeout` seconds, so new data from
+    `import_sr22` or `load_usda_snapshot` is picked up without a restart.
+    Call `clear` to drop everything immediately.  When more than
+    `max_entries` foods are cached, expired entries are culled, and if that is
+    not enough every other food is dropped.
+
+    By default queries go to the database chosen by the router.
+    """
+    def __init__(self, using=None, timeout=DEFAULT_TIMEOUT, max_entries=DEFAULT_MAX_ENTRIES):
+        self.using = using
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self._cache = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def load(self, ndb_number):
+        return self.load_many([ndb_number])[ndb_number]
+
+    def load_many(self, ndb_numbers):
+        """
+        Returns a dict mapping each NDB number to a dict of nutrient number to
+        nutrient value, per 100 grams.  Unknown foods map to an empty dict.
+        """
+        results = {}
+        pending = set([int(ndb_number) for ndb_number in ndb_numbers])
+
+        while pending:
+            fetch = []
+            wait = []
+
+            self._lock.acquire()
+            try:
+                for ndb_number in pending:
+                    values = self._get(ndb_number)
+                    if values is not None:
+                        results[ndb_number] = values
+                    elif ndb_number in self._in_flight:
+                        wait.append((ndb_number, self._in_flight[ndb_number]))
+                    else:
+                        self._in_flight[ndb_number] = threading.Event()
+                        fetch.append(ndb_number)
+            finally:
+                self._lock.release()
+
+            if fetch:
+                results.update(self._fetch(fetch))
+
+            for ndb_number, event in wait:
+                event.wait()
+
+            # Look the foods other threads fetched up again.  Any that failed,
+            # expired or were cleared in the meantime are fetched next time.
+            pending = set([ndb_number for ndb_number, event in wait])
+
+        return results
+
+    def _get(self, ndb_number):
+        """
+        Returns the cached values for `ndb_number`, or None if they are missing
+        or expired.  Must be called with the lock held.
+        """
+        entry = self._cache.get(ndb_number)
+        if entry is None:
+            return None
+        if entry[0] < time.time():
+            del self._cache[ndb_number]
+            return None
+        return entry[1]
+
+    def _cull(self, keep):
+        """
+        Drops expired foods and, if the cache is still too large, every food
+        not in `keep`.  Must be called with the lock held.
+        """
+        now = time.time()
+        for ndb_number, (expires, values) in self._cache.items():
+            if expires < now:
+                del self._cache[ndb_number]
+        if len(self._cache) > self.max_entries:
+            for ndb_number in self._cache.keys():
+                if ndb_number not in keep:
+                    del self._cache[ndb_number]
+
+    def _query(self, ndb_numbers):
+        results = dict([(ndb_number, {}) for ndb_number in ndb_numbers])
+        for food, nutrient, value in NutrientData.objects.using(self.using).filter(
+            food__in=ndb_numbers
+        ).values_list('food', 'nutrient', 'nutrient_value'):
+            results[food][nutrient] = value
+        return results
+
+    def _fetch(self, ndb_numbers):
+        """
+        Queries `ndb_numbers`, which must have been marked as in flight, and
+        caches and returns the results.
+        """
+        results = None
+        try:
+            results = self._query(ndb_numbers)
+        finally:
+            # Always release waiting threads, even if the query failed.
+            self._lock.acquire()
+            try:
+                if results is not None:
+                    expires = time.time() + self.timeout
+                    for ndb_number, values in results.items():
+                        self._cache[ndb_number] = (expires, values)
+                    if len(self._cache) > self.max_entries:
+                        self._cull(results)
+                for ndb_number in ndb_numbers:
+                    self._in_flight.pop(ndb_number).set()
+            finally:
+                self._lock.release()
+        return results
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._cache.clear()
+        finally:
+            self._lock.release()
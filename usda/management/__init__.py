@@ -0,0 +1,14 @@
+from django.db import router
+from django.db.models import signals
+
+from usda import models as usda_app
+from usda.indexes import create_indexes
+
+
+def create_usda_indexes(app, created_models, verbosity, db=None, **kwargs):
+    # `created_models` covers every app in the syncdb run, so make sure the
+    # usda tables were actually created on this database.
+    if db is not None and usda_app.NutrientData in created_models and router.allow_syncdb(db, usda_app.NutrientData):
+        create_indexes(db)
+
+signals.post_syncdb.connect(create_usda_indexes, sender=usda_app)
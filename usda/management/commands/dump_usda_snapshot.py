@@ -0,0 +1,29 @@
+import optparse
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from usda.snapshot import export_snapshot
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        optparse.make_option('-f', '--filename', action='store', dest='filename', help='The snapshot filename', default='usda.sqlite3'),
+        optparse.make_option('--database', action='store', dest='database', help='Specify database to export data from. Defaults to the "default" database.', default=DEFAULT_DB_ALIAS),
+    )
+    help = 'Exports all imported USDA data to a checksummed SQLite snapshot.'
+    
+    def handle(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        using = options.get('database', DEFAULT_DB_ALIAS)
+        filename = options['filename']
+        
+        if verbosity == 1:
+            logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+        elif verbosity > 1:
+            logging.basicConfig(level=logging.DEBUG, format='%(levelname)s - %(message)s')
+        
+        logging.info('Writing snapshot to %s...' % filename)
+        
+        export_snapshot(filename, using)
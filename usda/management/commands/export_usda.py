@@ -0,0 +1,177 @@
+import csv
+import itertools
+import optparse
+import logging
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import simplejson
+
+from usda.cursors import stream_query
+from usda.models import Food, Nutrient, NutrientData, Weight
+
+
+# Number of rows to fetch from the database cursor at once.
+EXPORT_STEP = 2000
+
+FORMAT_CSV = 'csv'
+FORMAT_JSONL = 'jsonl'
+
+LAYOUT_LONG = 'long'
+LAYOUT_WIDE = 'wide'
+
+KIND_NUTRIENTS = 'nutrients'
+KIND_WEIGHTS = 'weights'
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        optparse.make_option('-o', '--output', action='store', dest='output', help='The output filename. Defaults to stdout.', default=None),
+        optparse.make_option('--database', action='store', dest='database', help='Specify database to export data from. Defaults to the "default" database.', default=DEFAULT_DB_ALIAS),
+        optparse.make_option('--format', action='store', dest='format', type='choice', choices=(FORMAT_CSV, FORMAT_JSONL), help='Output format, csv or jsonl. Defaults to csv.', default=FORMAT_CSV),
+        optparse.make_option('--layout', action='store', dest='layout', type='choice', choices=(LAYOUT_LONG, LAYOUT_WIDE), help='One row per food and nutrient (long) or one row per food with a column per nutrient (wide). Defaults to long.', default=LAYOUT_LONG),
+        optparse.make_option('--weights', action='store_const', dest='kind', const=KIND_WEIGHTS, help='Export food weights instead of nutrient data.', default=KIND_NUTRIENTS),
+    )
+    help = 'Streams all foods with their nutrient data or weights as CSV or JSON Lines.'
+
+    def handle(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        using = options.get('database', DEFAULT_DB_ALIAS)
+        output_format = options.get('format')
+        layout = options.get('layout')
+        kind = options.get('kind')
+
+        if kind == KIND_WEIGHTS and layout == LAYOUT_WIDE:
+            raise CommandError('--layout=wide is only available for nutrient data')
+
+        if verbosity > 1:
+            logging.basicConfig(level=logging.DEBUG, format='%(levelname)s - %(message)s')
+
+        if options.get('output'):
+            stream = open(options['output'], 'wb')
+        else:
+            stream = sys.stdout
+
+        try:
+            if kind == KIND_WEIGHTS:
+                fieldnames, rows = weight_rows(using)
+            elif layout == LAYOUT_WIDE:
+                fieldnames, rows = wide_nutrient_rows(using)
+            else:
+                fieldnames, rows = long_nutrient_rows(using)
+
+            if output_format == FORMAT_JSONL:
+                total = write_jsonl(stream, fieldnames, rows)
+            else:
+                total = write_csv(stream, fieldnames, rows)
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+
+        logging.debug('Exported %d rows' % total)
+
+
+def column(model, name):
+    return '%s.%s' % (model._meta.db_table, model._meta.get_field(name).column)
+
+
+FOOD_COLUMNS = (
+    ('ndb_number', (Food, 'ndb_number')),
+    ('food_group', (Food, 'food_group')),
+    ('long_description', (Food, 'long_description')),
+)
+
+
+def long_nutrient_rows(using):
+    """
+    Returns the field names and a row iterator for one row per nutrient value.
+    """
+    columns = FOOD_COLUMNS + (
+        ('nutrient_number', (Nutrient, 'number')),
+        ('nutrient_tagname', (Nutrient, 'tagname')),
+        ('nutrient_description', (Nutrient, 'description')),
+        ('nutrient_units', (Nutrient, 'units')),
+        ('nutrient_value', (NutrientData, 'nutrient_value')),
+        ('data_points', (NutrientData, 'data_points')),
+        ('standard_error', (NutrientData, 'standard_error')),
+    )
+    sql = 'SELECT %s FROM %s INNER JOIN %s ON %s = %s INNER JOIN %s ON %s = %s ORDER BY %s, %s' % (
+        ', '.join([column(*source) for name, source in columns]),
+        NutrientData._meta.db_table,
+        Food._meta.db_table, column(NutrientData, 'food'), column(Food, 'ndb_number'),
+        Nutrient._meta.db_table, column(NutrientData, 'nutrient'), column(Nutrient, 'number'),
+        column(NutrientData, 'food'), column(NutrientData, 'nutrient'),
+    )
+    return [name for name, source in columns], stream_query(using, sql, EXPORT_STEP, 'usda_export')
+
+
+def wide_nutrient_rows(using):
+    """
+    Returns the field names and a row iterator for one row per food, with one
+    column per nutrient. Nutrients a food has no value for are left empty.
+    """
+    nutrients = list(Nutrient.objects.using(using).order_by('order').values_list('number', 'tagname'))
+    positions = dict([(number, i) for i, (number, tagname) in enumerate(nutrients)])
+    fieldnames = [name for name, source in FOOD_COLUMNS] + [
+        tagname or str(number) for number, tagname in nutrients
+    ]
+
+    sql = 'SELECT %s, %s, %s FROM %s INNER JOIN %s ON %s = %s ORDER BY %s' % (
+        ', '.join([column(*source) for name, source in FOOD_COLUMNS]),
+        column(NutrientData, 'nutrient'), column(NutrientData, 'nutrient_value'),
+        NutrientData._meta.db_table,
+        Food._meta.db_table, column(NutrientData, 'food'), column(Food, 'ndb_number'),
+        column(NutrientData, 'food'),
+    )
+
+    def rows():
+        width = len(FOOD_COLUMNS)
+        for food, values in itertools.groupby(stream_query(using, sql, EXPORT_STEP, 'usda_export'), lambda row: row[:width]):
+            pivot = [None] * len(nutrients)
+            for value in values:
+                pivot[positions[value[width]]] = value[width + 1]
+            yield tuple(food) + tuple(pivot)
+
+    return fieldnames, rows()
+
+
+def weight_rows(using):
+    """
+    Returns the field names and a row iterator for one row per food weight.
+    """
+    columns = FOOD_COLUMNS + (
+        ('sequence', (Weight, 'sequence')),
+        ('amount', (Weight, 'amount')),
+        ('description', (Weight, 'description')),
+        ('gram_weight', (Weight, 'gram_weight')),
+    )
+    sql = 'SELECT %s FROM %s INNER JOIN %s ON %s = %s ORDER BY %s, %s' % (
+        ', '.join([column(*source) for name, source in columns]),
+        Weight._meta.db_table,
+        Food._meta.db_table, column(Weight, 'food'), column(Food, 'ndb_number'),
+        column(Weight, 'food'), column(Weight, 'sequence'),
+    )
+    return [name for name, source in columns], stream_query(using, sql, EXPORT_STEP, 'usda_export')
+
+
+def write_csv(stream, fieldnames, rows):
+    total = 0
+    writer = csv.writer(stream)
+    writer.writerow(fieldnames)
+    for row in rows:
+        writer.writerow([
+            isinstance(value, unicode) and value.encode('utf-8') or value
+            for value in row
+        ])
+        total += 1
+    return total
+
+
+def write_jsonl(stream, fieldnames, rows):
+    total = 0
+    for row in rows:
+        stream.write(simplejson.dumps(dict(zip(fieldnames, row))))
+        stream.write('\n')
+        total += 1
+    return total
@@ -107,31 +107,31 @@ class Command(BaseCommand):
         
         if parse_all or parse_group:
             logging.info('Reading %s...' % FD_GROUP)
-            create_update_food_groups(''.join([byte for byte in zip_file.read(FD_GROUP)]).splitlines())
+            create_update_food_groups(''.join([byte for byte in zip_file.read(FD_GROUP)]).splitlines(), using)
         if parse_all or parse_food:
             logging.info('Reading %s...' % FOOD_DES)
-            create_update_foods(''.join([byte for byte in zip_file.read(FOOD_DES)]).splitlines(), encoding)
+            create_update_foods(''.join([byte for byte in zip_file.read(FOOD_DES)]).splitlines(), encoding, using)
         if parse_all or parse_weight:
             logging.info('Reading %s...' % WEIGHT)
-            create_update_weights(''.join([byte for byte in zip_file.read(WEIGHT)]).splitlines())
+            create_update_weights(''.join([byte for byte in zip_file.read(WEIGHT)]).splitlines(), using)
         if parse_all or parse_nutrient:
             logging.info('Reading %s...' % NUTR_DEF)
-            create_update_nutrients(''.join([byte for byte in zip_file.read(NUTR_DEF)]).splitlines(), encoding)
+            create_update_nutrients(''.join([byte for byte in zip_file.read(NUTR_DEF)]).splitlines(), encoding, using)
         if parse_all or parse_footnote:
             logging.info('Reading %s...' % FOOTNOTE)
-            create_update_footnotes(''.join([byte for byte in zip_file.read(FOOTNOTE)]).splitlines())
+            create_update_footnotes(''.join([byte for byte in zip_file.read(FOOTNOTE)]).splitlines(), using)
         if parse_all or parse_datasource:
             logging.info('Reading %s...' % DATA_SRC)
-            create_update_data_sources(''.join([byte for byte in zip_file.read(DATA_SRC)]).splitlines())
+            create_update_data_sources(''.join([byte for byte in zip_file.read(DATA_SRC)]).splitlines(), using)
         if parse_all or parse_derivation:
             logging.info('Reading %s...' % DERIV_CD)
-            create_update_derivations(''.join([byte for byte in zip_file.read(DERIV_CD)]).splitlines())
+            create_update_derivations(''.join([byte for byte in zip_file.read(DERIV_CD)]).splitlines(), using)
         if parse_all or parse_source:
             logging.info('Reading %s...' % SRC_CD)
-            create_update_sources(''.join([byte for byte in zip_file.read(SRC_CD)]).splitlines())
+            create_update_sources(''.join([byte for byte in zip_file.read(SRC_CD)]).splitlines(), using)
         if parse_all or parse_data:
             logging.info('Reading %s...' % NUT_DATA)
-            create_update_nutrient_data(''.join([byte for byte in zip_file.read(NUT_DATA)]).splitlines())
+            create_update_nutrient_data(''.join([byte for byte in zip_file.read(NUT_DATA)]).splitlines(), using)
         
         transaction.commit(using=using)
         transaction.leave_transaction_management(using=using)
@@ -139,7 +139,7 @@ class Command(BaseCommand):
         zip_file.close()
 
 
-def create_update_food_groups(data):
+def create_update_food_groups(data, using):
     total_created = 0
     total_updated = 0
     
@@ -152,7 +152,7 @@ def create_update_food_groups(data):
         created = False
         
         try:
-            food_group = FoodGroup.objects.get(code=int(row['fdgrp_cd']))
+            food_group = FoodGroup.objects.using(using).get(code=int(row['fdgrp_cd']))
             total_updated += 1
         except FoodGroup.DoesNotExist:
             food_group = FoodGroup(code=int(row['fdgrp_cd']))
@@ -160,7 +160,7 @@ def create_update_food_groups(data):
             created = True
         
         food_group.description = row['fdgrp_desc']
-        food_group.save()
+        food_group.save(using=using)
         
         if created:
             logging.debug('Created %s' % food_group)
@@ -171,7 +171,7 @@ def create_update_food_groups(data):
     logging.info('Updated %d food groups' % total_updated)
 
 
-def create_update_foods(data, encoding):
+def create_update_foods(data, encoding, using):
     total_created = 0
     total_updated = 0
     
@@ -190,14 +190,14 @@ def create_update_foods(data, encoding):
         created = False
         
         try:
-            food = Food.objects.get(ndb_number=int(row['ndb_no']))
+            food = Food.objects.using(using).get(ndb_number=int(row['ndb_no']))
             total_updated += 1
         except Food.DoesNotExist:
             food = Food(ndb_number=int(row['ndb_no']))
             total_created += 1
             created = True
         
-        food.food_group = FoodGroup.objects.get(code=int(row['fdgrp_cd']))
+        food.food_group = FoodGroup.objects.using(using).get(code=int(row['fdgrp_cd']))
         food.long_description = row.get('long_desc')
         food.short_description = row.get('short_desc')
         food.common_name = row.get('com_name')
@@ -218,7 +218,7 @@ def create_update_foods(data, encoding):
         if row.get('cho_factor'):
             food.cho_factor = float(row['cho_factor'])
         
-        food.save()
+        food.save(using=using)
         
         if created:
             logging.debug('Created %s' % food)
@@ -229,7 +229,7 @@ def create_update_foods(data, encoding):
     logging.info('Updated %d foods' % total_updated)
 
 
-def create_update_weights(data):
+def create_update_weights(data, using):
     total_created = 0
     total_updated = 0
     
@@ -244,14 +244,14 @@ def create_update_weights(data):
         created = False
         
         try:
-            weight = Weight.objects.get(
-                food=Food.objects.get(ndb_number=int(row['ndb_no'])),
+            weight = Weight.objects.using(using).get(
+                food=Food.objects.using(using).get(ndb_number=int(row['ndb_no'])),
                 sequence=int(row['seq'])
             )
             total_updated += 1
         except Weight.DoesNotExist:
             weight = Weight(
-                food=Food.objects.get(ndb_number=int(row['ndb_no'])),
+                food=Food.objects.using(using).get(ndb_number=int(row['ndb_no'])),
                 sequence=int(row['seq'])
             )
             total_created += 1
@@ -264,7 +264,7 @@ def create_update_weights(data):
             weight.number_of_data_points = float(row['num_data_pts'])
         if row.get('std_dev'):
             weight.standard_deviation = float(row['std_dev'])
-        weight.save()
+        weight.save(using=using)
         
         if created:
             logging.debug('Created %s' % weight)
@@ -275,7 +275,7 @@ def create_update_weights(data):
     logging.info('Updated %d weights' % total_updated)
 
 
-def create_update_nutrients(data, encoding):
+def create_update_nutrients(data, encoding, using):
     total_created = 0
     total_updated = 0
     
@@ -291,7 +291,7 @@ def create_update_nutrients(data, encoding):
         created = False
         
         try:
-            nutrient = Nutrient.objects.get(number=int(row['nutr_no']))
+            nutrient = Nutrient.objects.using(using).get(number=int(row['nutr_no']))
             total_updated += 1
         except Nutrient.DoesNotExist:
             nutrient = Nutrient(number=int(row['nutr_no']))
@@ -303,7 +303,7 @@ def create_update_nutrients(data, encoding):
         nutrient.description = row['nutrdesc']
         nutrient.decimals = int(row['num_dec'])
         nutrient.order = int(row['sr_order'])
-        nutrient.save()
+        nutrient.save(using=using)
         
         if created:
             logging.debug('Created %s' % nutrient)
@@ -314,7 +314,7 @@ def create_update_nutrients(data, encoding):
     logging.info('Updated %d nutrients' % total_updated)
 
 
-def create_update_footnotes(data):
+def create_update_footnotes(data, using):
     total_created = 0
     total_updated = 0
     
@@ -337,20 +337,20 @@ def create_update_footnotes(data):
             row['footnt_typ'] = FOOTNOTE_NUTR
         
         if row.get('nutr_no'):
-            nutrient = Nutrient.objects.get(number=int(row['nutr_no']))
+            nutrient = Nutrient.objects.using(using).get(number=int(row['nutr_no']))
         else:
             nutrient = None
         
         try:
-            footnote = Footnote.objects.get(
-                food=Food.objects.get(ndb_number=int(row['ndb_no'])),
+            footnote = Footnote.objects.using(using).get(
+                food=Food.objects.using(using).get(ndb_number=int(row['ndb_no'])),
                 number=int(row['footnt_no']),
                 nutrient=nutrient
             )
             total_updated += 1
         except Footnote.DoesNotExist:
             footnote = Footnote(
-                food=Food.objects.get(ndb_number=int(row['ndb_no'])),
+                food=Food.objects.using(using).get(ndb_number=int(row['ndb_no'])),
                 number=int(row['footnt_no']),
                 nutrient=nutrient
             )
@@ -359,7 +359,7 @@ def create_update_footnotes(data):
         
         footnote.type = row['footnt_typ']
         footnote.text = row['footnt_txt']
-        footnote.save()
+        footnote.save(using=using)
         
         if created:
             logging.debug('Created %s' % footnote)
@@ -370,7 +370,7 @@ def create_update_footnotes(data):
     logging.info('Updated %d footnotes' % total_updated)
 
 
-def create_update_data_sources(data):
+def create_update_data_sources(data, using):
     total_created = 0
     total_updated = 0
     
@@ -386,7 +386,7 @@ def create_update_data_sources(data):
         created = False
         
         try:
-            data_source = DataSource.objects.get(id=row['datasrc_id'])
+            data_source = DataSource.objects.using(using).get(id=row['datasrc_id'])
             total_updated += 1
         except DataSource.DoesNotExist:
             data_source = DataSource(id=row['datasrc_id'])
@@ -404,7 +404,7 @@ def create_update_data_sources(data):
             data_source.start_page = row.get('start_page')
         if row.get('end_page'):
             data_source.end_page = row.get('end_page')
-        data_source.save()
+        data_source.save(using=using)
         
         if created:
             logging.debug('Created %s' % data_source)
@@ -415,7 +415,7 @@ def create_update_data_sources(data):
     logging.info('Updated %d data sources' % total_updated)
 
 
-def create_update_derivations(data):
+def create_update_derivations(data, using):
     total_created = 0
     total_updated = 0
     
@@ -428,7 +428,7 @@ def create_update_derivations(data):
         created = False
         
         try:
-            derivation = DataDerivation.objects.get(code=row['deriv_cd'])
+            derivation = DataDerivation.objects.using(using).get(code=row['deriv_cd'])
             total_updated += 1
         except DataDerivation.DoesNotExist:
             derivation = DataDerivation(code=row['deriv_cd'])
@@ -439,7 +439,7 @@ def create_update_derivations(data):
         # however, there is at least one instance where `deriv_desc` is greater
         # than this max.  To deal with this, truncate to 120 characters.
         derivation.description = row['deriv_desc'][:120]
-        derivation.save()
+        derivation.save(using=using)
         
         if created:
             logging.debug('Created %s' % derivation)
@@ -450,7 +450,7 @@ def create_update_derivations(data):
     logging.info('Updated %d derivations' % total_updated)
 
 
-def create_update_sources(data):
+def create_update_sources(data, using):
     total_created = 0
     total_updated = 0
     
@@ -463,7 +463,7 @@ def create_update_sources(data):
         created = False
         
         try:
-            source = Source.objects.get(code=int(row['src_cd']))
+            source = Source.objects.using(using).get(code=int(row['src_cd']))
             total_updated += 1
         except Source.DoesNotExist:
             source = Source(code=int(row['src_cd']))
@@ -471,7 +471,7 @@ def create_update_sources(data):
             created = True
         
         source.description = row['srccd_desc']
-        source.save()
+        source.save(using=using)
         
         if created:
             logging.debug('Created %s' % source)
@@ -482,7 +482,7 @@ def create_update_sources(data):
     logging.info('Updated %d sources' % total_updated)
 
 
-def create_update_nutrient_data(data):
+def create_update_nutrient_data(data, using):
     total_created = 0
     total_updated = 0
     
@@ -502,15 +502,15 @@ def create_update_nutrient_data(data):
             created = False
         
             try:
-                nutrient_data = NutrientData.objects.get(
-                    food=Food.objects.get(ndb_number=int(row['ndb_no'])),
-                    nutrient=Nutrient.objects.get(number=int(row['nutr_no']))
+                nutrient_data = NutrientData.objects.using(using).get(
+                    food=Food.objects.using(using).get(ndb_number=int(row['ndb_no'])),
+                    nutrient=Nutrient.objects.using(using).get(number=int(row['nutr_no']))
                 )
                 total_updated += 1
             except NutrientData.DoesNotExist:
                 nutrient_data = NutrientData(
-                    food=Food.objects.get(ndb_number=int(row['ndb_no'])),
-                    nutrient=Nutrient.objects.get(number=int(row['nutr_no']))
+                    food=Food.objects.using(using).get(ndb_number=int(row['ndb_no'])),
+                    nutrient=Nutrient.objects.using(using).get(number=int(row['nutr_no']))
                 )
                 total_created += 1
                 created = True
@@ -520,7 +520,7 @@ def create_update_nutrient_data(data):
             if row.get('std_error'):
                 nutrient_data.standard_error = float(row['std_error'])
             if row.get('deriv_cd'):
-                nutrient_data.data_derivation = DataDerivation.objects.get(code=row['deriv_cd'])
+                nutrient_data.data_derivation = DataDerivation.objects.using(using).get(code=row['deriv_cd'])
             if row.get('ref_ndb_no'):
                 nutrient_data.reference_nbd_number = int(row['ref_ndb_no'])
             if row.get('add_nutr_mark'):
@@ -539,11 +539,14 @@ def create_update_nutrient_data(data):
                 nutrient_data.upper_error_bound = float(row['up_eb'])
             nutrient_data.statistical_comments = row.get('stat_cmt')
             nutrient_data.confidence_code = row.get('cc')
-            nutrient_data.save()
+            nutrient_data.save(using=using)
         
             if row.get('src_cd'):
-                nutrient_data.source.add(Source.objects.get(code=row['src_cd']))
-                nutrient_data.save()
+                NutrientData.source.through.objects.using(using).get_or_create(
+                    nutrientdata=nutrient_data,
+                    source=Source.objects.using(using).get(code=row['src_cd'])
+                )
+                nutrient_data.save(using=using)
         
             if created:
                 logging.debug('Created %s' % nutrient_data)
@@ -0,0 +1,51 @@
+import optparse
+import logging
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction, DEFAULT_DB_ALIAS
+
+from usda.snapshot import import_snapshot, verify_checksum, CHECKSUM_SUFFIX
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        optparse.make_option('-f', '--filename', action='store', dest='filename', help='The snapshot filename', default='usda.sqlite3'),
+        optparse.make_option('--database', action='store', dest='database', help='Specify database to load data into. Defaults to the "default" database.', default=DEFAULT_DB_ALIAS),
+        optparse.make_option('--no-verify', action='store_false', dest='verify', help='Skip verification of the snapshot checksum.', default=True),
+    )
+    help = 'Replaces all USDA data with the contents of a SQLite snapshot.'
+    
+    def handle(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        using = options.get('database', DEFAULT_DB_ALIAS)
+        filename = options['filename']
+        
+        if not os.path.exists(filename):
+            raise CommandError('%s does not exist' % filename)
+        
+        if verbosity == 1:
+            logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+        elif verbosity > 1:
+            logging.basicConfig(level=logging.DEBUG, format='%(levelname)s - %(message)s')
+        
+        if options.get('verify'):
+            logging.info('Verifying %s...' % filename)
+            if not os.path.exists(filename + CHECKSUM_SUFFIX):
+                raise CommandError('%s%s does not exist' % (filename, CHECKSUM_SUFFIX))
+            if not verify_checksum(filename):
+                raise CommandError('%s does not match its checksum' % filename)
+        
+        transaction.commit_unless_managed(using=using)
+        transaction.enter_transaction_management(using=using)
+        transaction.managed(True, using=using)
+        
+        try:
+            import_snapshot(filename, using)
+        except:
+            transaction.rollback(using=using)
+            transaction.leave_transaction_management(using=using)
+            raise
+        
+        transaction.commit(using=using)
+        transaction.leave_transaction_management(using=using)
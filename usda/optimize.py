@@ -0,0 +1,634 @@
+"""
+Meal plan optimization over the nutrient matrix.
+
+A `DietProblem` loads nutrient values and portion sizes for a set of
+candidate foods once, then solves any number of plans against it.  Each plan
+chooses a whole number of portions of each food so that the chosen nutrient
+totals fall within the given bounds at minimum cost.
+
+Plans are found by branch and bound over whole portions.  Each node solves
+a linear relaxation with a bounded revised simplex method over sparse
+columns, and rounds it to whole portions for a plan to prune against.  The
+reduced costs of the first relaxation rule out foods that cannot appear in a
+cheaper plan, and later relaxations start from a small set of foods and
+price in the rest only when they could lower the cost.
+"""
+import math
+
+from usda.models import Food, NutrientData, Weight
+
+
+# Nutrient number for energy in kcal, used as the default cost.
+ENERGY = 208
+
+# Portion used for foods without a weight.
+DEFAULT_PORTION_GRAMS = 100.0
+
+# Number of columns priced before taking the best one found so far.
+PRICING_BLOCK = 250
+
+# Number of foods, besides those in the root relaxation, that branch and
+# bound nodes start from before pricing in the rest.
+ACTIVE_FOODS = 50
+
+# Consecutive degenerate pivots after which Bland's rule is used.
+DEGENERATE_PIVOTS = 50
+
+EPSILON = 1e-9
+
+# Distance from a whole number below which a portion counts as whole.
+INTEGRALITY = 1e-6
+INFINITY = float('inf')
+
+
+class SolverError(Exception):
+    pass
+
+
+class Plan(object):
+    """
+    The result of `DietProblem.solve`.
+
+    `portions` maps NDB number to a number of portions, `nutrients` maps
+    nutrient number to the total amount in the plan and `feasible` is False
+    if no plan meeting every bound exists.  `optimal` is False if the search
+    stopped before proving the plan is the cheapest.
+    """
+    def __init__(self, portions, cost, nutrients, feasible, optimal=True):
+        self.portions = portions
+        self.cost = cost
+        self.nutrients = nutrients
+        self.feasible = feasible
+        self.optimal = optimal
+
+    def __repr__(self):
+        return '<Plan: %d foods, cost %.2f%s>' % (
+            len(self.portions), self.cost, not self.feasible and ', infeasible' or ''
+        )
+
+
+class DietProblem(object):
+    """
+    Candidate foods with their nutrient values per portion.
+
+    A food's portion is its first `Weight`, by sequence, or 100 grams when it
+    has none.  Loading the problem takes two queries regardless of the number
+    of foods.
+    """
+    def __init__(self, foods, nutrients, using=None):
+        self.ndb_numbers = [isinstance(food, Food) and food.pk or int(food) for food in foods]
+        self.nutrients = list(nutrients)
+        if ENERGY not in self.nutrients:
+            self.nutrients.append(ENERGY)
+
+        grams = dict([(ndb_number, DEFAULT_PORTION_GRAMS) for ndb_number in self.ndb_numbers])
+        self.portion_descriptions = {}
+        for food, amount, description, gram_weight in Weight.objects.using(using).filter(
+            food__in=self.ndb_numbers, sequence=1
+        ).values_list('food', 'amount', 'description', 'gram_weight'):
+            grams[food] = gram_weight
+            self.portion_descriptions[food] = u'%g %s' % (amount, description)
+
+        # Sparse food columns of nutrient number to amount per portion
+        self.columns = dict([(ndb_number, {}) for ndb_number in self.ndb_numbers])
+        for food, nutrient, value in NutrientData.objects.using(using).filter(
+            food__in=self.ndb_numbers, nutrient__in=self.nutrients
+        ).values_list('food', 'nutrient', 'nutrient_value'):
+            self.columns[food][nutrient] = value * grams[food] / 100.0
+
+    def solve(self, bounds, costs=None, max_portions=10, max_iterations=10000, max_nodes=100):
+        """
+        Returns the cheapest `Plan` meeting `bounds`, a dict mapping nutrient
+        number to a (lower, upper) tuple where either may be None.  Raises
+        ValueError for nutrients that were not loaded.
+
+        `costs` maps NDB number to the cost of one portion and defaults to its
+        energy in kcal.  `max_portions` limits the portions of any one food.
+
+        Whole portions are found by branch and bound over the linear
+        relaxation.  If the search is stopped after `max_nodes` relaxations,
+        the best plan found so far is returned with `optimal` set to False,
+        and SolverError is raised if no plan had been found.  SolverError is
+        also raised if a relaxation needs more than `max_iterations` pivots.
+        """
+        unknown = [nutrient for nutrient in bounds if nutrient not in self.nutrients]
+        if unknown:
+            raise ValueError('No data loaded for bounded nutrients %s' % ', '.join([str(nutrient) for nutrient in sorted(unknown)]))
+
+        if costs is None:
+            costs = dict([(ndb_number, self.columns[ndb_number].get(ENERGY, 0.0)) for ndb_number in self.ndb_numbers])
+
+        # Build one row per bounded nutrient, as (rhs, surplus).  A row with a
+        # lower bound has a surplus bounded above by the gap to any upper
+        # bound; a row with only an upper bound has a surplus of None.
+        rows = []
+        for nutrient, (lower, upper) in bounds.items():
+            if lower is not None and upper is not None and lower > upper:
+                return self._plan({}, costs, bounds, False)
+            if lower is not None and lower > 0:
+                if upper is None:
+                    rows.append((nutrient, float(lower), INFINITY))
+                else:
+                    rows.append((nutrient, float(lower), float(upper - lower)))
+            elif upper is not None:
+                if upper < 0:
+                    return self._plan({}, costs, bounds, False)
+                rows.append((nutrient, float(upper), None))
+        row_indexes = dict([(nutrient, i) for i, (nutrient, rhs, surplus) in enumerate(rows)])
+        rows = [(rhs, surplus) for nutrient, rhs, surplus in rows]
+
+        columns = []
+        cost = []
+        for ndb_number in self.ndb_numbers:
+            column = {}
+            for nutrient, value in self.columns[ndb_number].items():
+                if value and nutrient in row_indexes:
+                    column[row_indexes[nutrient]] = value
+            columns.append(column)
+            cost.append(float(costs.get(ndb_number, 0.0)))
+
+        n = len(self.ndb_numbers)
+        best, best_cost = None, INFINITY
+        optimal = True
+        nodes = 0
+        fixed = {}
+        active = None
+
+        # Depth-first branch and bound.  Each node narrows the portion limits
+        # of one food whose relaxed value is fractional.
+        stack = [([0] * n, [max_portions] * n)]
+        while stack:
+            if nodes >= max_nodes:
+                optimal = False
+                break
+            lower, upper = stack.pop()
+            if fixed:
+                # A node that excludes a fixed food holds no cheaper plan
+                if [j for j, count in fixed.items() if not lower[j] <= count <= upper[j]]:
+                    continue
+                lower, upper = list(lower), list(upper)
+                for j, count in fixed.items():
+                    lower[j] = upper[j] = count
+            nodes += 1
+
+            relaxed = _relaxation(rows, columns, cost, lower, upper, max_iterations, active)
+            if relaxed is None:
+                continue
+            values, reduced = relaxed
+            objective = sum([cost[j] * values[j] for j in range(n)])
+
+            if nodes == 1:
+                root_objective, root_values, root_reduced = objective, values, reduced
+                # Later nodes start from the foods the root relaxation uses
+                # and those closest to entering it.
+                active = set([j for j in range(n) if values[j] > INTEGRALITY])
+                active.update(sorted(range(n), key=lambda j: reduced[j])[:ACTIVE_FOODS])
+            if best is not None and objective >= best_cost - EPSILON * max(1.0, abs(best_cost)):
+                continue
+
+            # Rounding the relaxation often finds a cheaper plan to prune
+            # against, and to fix more foods with.  Below the root, only the
+            # active foods are considered for extra portions.
+            if nodes == 1:
+                limits = upper
+            else:
+                limits = [(j in active and upper[j]) or lower[j] for j in range(n)]
+            portions = self._round(values, limits, bounds, costs)
+            if portions is not None and self._cost(portions, costs) < best_cost:
+                best, best_cost = portions, self._cost(portions, costs)
+                fixed = _fix(root_objective, root_values, root_reduced, best_cost, max_portions)
+                if objective >= best_cost - EPSILON * max(1.0, abs(best_cost)):
+                    continue
+
+            branch, distance = None, INTEGRALITY
+            for j in range(n):
+                fraction = values[j] - math.floor(values[j])
+                if min(fraction, 1.0 - fraction) > distance:
+                    branch, distance = j, min(fraction, 1.0 - fraction)
+            if branch is None:
+                portions = {}
+                for j in range(n):
+                    count = int(math.floor(values[j] + 0.5))
+                    if count:
+                        portions[self.ndb_numbers[j]] = count
+                best, best_cost = portions, self._cost(portions, costs)
+                fixed = _fix(root_objective, root_values, root_reduced, best_cost, max_portions)
+                continue
+
+            down = list(upper)
+            down[branch] = int(math.floor(values[branch]))
+            up = list(lower)
+            up[branch] = down[branch] + 1
+            # Explore the branch nearer the relaxed value first
+            if values[branch] - down[branch] < 0.5:
+                stack.append((up, upper))
+                stack.append((lower, down))
+            else:
+                stack.append((lower, down))
+                stack.append((up, upper))
+
+        if best is None:
+            if not optimal:
+                raise SolverError('No plan found within %d nodes' % max_nodes)
+            return self._plan({}, costs, bounds, False)
+        return self._plan(best, costs, bounds, True, optimal)
+
+    def solve_many(self, problems, max_portions=10, max_iterations=10000, max_nodes=100):
+        """
+        Solves a list of `bounds` dicts or (`bounds`, `costs`) tuples against
+        the same candidate foods, returning a list of plans.
+        """
+        plans = []
+        for problem in problems:
+            if isinstance(problem, dict):
+                problem = (problem, None)
+            plans.append(self.solve(problem[0], problem[1], max_portions, max_iterations, max_nodes))
+        return plans
+
+    def _totals(self, portions):
+        totals = dict([(nutrient, 0.0) for nutrient in self.nutrients])
+        for ndb_number, count in portions.items():
+            if not count:
+                continue
+            for nutrient, value in self.columns[ndb_number].items():
+                totals[nutrient] += value * count
+        return totals
+
+    def _cost(self, portions, costs):
+        return sum([costs.get(ndb_number, 0.0) * count for ndb_number, count in portions.items()])
+
+    def _round(self, relaxed, limits, bounds, costs):
+        """
+        Rounds relaxed portion values, in the order of `ndb_numbers`, down to
+        whole portions.  Portions of any food are then added, up to its entry
+        in `limits`, until every lower bound is met, and portions no bound
+        needs are removed, most expensive first.  Returns None if no plan is
+        found this way.
+        """
+        portions = {}
+        for index, ndb_number in enumerate(self.ndb_numbers):
+            portions[ndb_number] = int(math.floor(relaxed[index] + INTEGRALITY))
+        totals = self._totals(portions)
+
+        def fits(ndb_number, sign):
+            for nutrient, value in self.columns[ndb_number].items():
+                if not value or nutrient not in bounds:
+                    continue
+                lower, upper = bounds[nutrient]
+                total = totals[nutrient] + sign * value
+                if sign > 0 and upper is not None and total > upper + EPSILON:
+                    return False
+                if sign < 0 and lower is not None and total < lower - EPSILON:
+                    return False
+            return True
+
+        def add(ndb_number, sign):
+            portions[ndb_number] += sign
+            for nutrient, value in self.columns[ndb_number].items():
+                totals[nutrient] += sign * value
+
+        while True:
+            shortfalls = {}
+            for nutrient, (lower, upper) in bounds.items():
+                if lower is not None and totals[nutrient] < lower - EPSILON:
+                    shortfalls[nutrient] = lower - totals[nutrient]
+            if not shortfalls:
+                break
+
+            best, best_score = None, 0.0
+            for index, ndb_number in enumerate(self.ndb_numbers):
+                if portions[ndb_number] >= limits[index]:
+                    continue
+                column = self.columns[ndb_number]
+                score = 0.0
+                for nutrient, shortfall in shortfalls.items():
+                    value = column.get(nutrient)
+                    if value:
+                        score += min(value, shortfall) / shortfall
+                score /= max(costs.get(ndb_number, 0.0), EPSILON)
+                if score > best_score and fits(ndb_number, 1):
+                    best, best_score = ndb_number, score
+            if best is None:
+                return None
+            add(best, 1)
+
+        chosen = [ndb_number for ndb_number, count in portions.items() if count]
+        for ndb_number in sorted(chosen, key=lambda ndb_number: -costs.get(ndb_number, 0.0)):
+            if costs.get(ndb_number, 0.0) <= 0:
+                break
+            while portions[ndb_number] and fits(ndb_number, -1):
+                add(ndb_number, -1)
+
+        for nutrient, (lower, upper) in bounds.items():
+            if upper is not None and totals[nutrient] > upper + EPSILON:
+                return None
+        return dict([(ndb_number, count) for ndb_number, count in portions.items() if count])
+
+    def _plan(self, portions, costs, bounds, feasible, optimal=True):
+        totals = self._totals(portions)
+        if feasible:
+            for nutrient, (lower, upper) in bounds.items():
+                if lower is not None and totals[nutrient] < lower - EPSILON:
+                    feasible = False
+                if upper is not None and totals[nutrient] > upper + EPSILON:
+                    feasible = False
+        return Plan(portions, self._cost(portions, costs), totals, feasible, optimal)
+
+
+def _relaxation(rows, columns, cost, lower, upper, max_iterations, active=None):
+    """
+    Solves the linear relaxation of a plan with between `lower[j]` and
+    `upper[j]` portions of food `j`.  `rows` holds an (rhs, surplus) tuple
+    per bounded nutrient and `columns` the sparse food columns over them.
+
+    If `active` is given, only the foods in that set enter the simplex; the
+    rest are held at their lower limit and priced against its duals.  Foods
+    that could improve the relaxation are added to `active` and it is solved
+    again, so the result is the same as solving over every food.
+
+    Returns a tuple of the portion values and the reduced cost of each food,
+    or None if no values meet the rows.  Foods whose limits are equal have a
+    reduced cost of zero.
+    """
+    n = len(columns)
+
+    # Shift each food by its lower limit, then negate any row left with a
+    # negative right hand side so the starting basis is feasible.
+    b = [rhs for rhs, surplus in rows]
+    for j in range(n):
+        if lower[j]:
+            for i, value in columns[j].items():
+                b[i] -= value * lower[j]
+    signs = []
+    for rhs in b:
+        if rhs < 0:
+            signs.append(-1.0)
+        else:
+            signs.append(1.0)
+    b = [abs(rhs) for rhs in b]
+
+    candidates = [j for j in range(n) if upper[j] > lower[j]]
+    if active is None:
+        active = set(candidates)
+
+    def price(duals, cost):
+        reduced = [0.0] * n
+        for j in candidates:
+            total = cost[j]
+            for i, value in columns[j].items():
+                total -= duals[i] * signs[i] * value
+            reduced[j] = total
+        return reduced
+
+    while True:
+        free = [j for j in candidates if j in active]
+        simplex_columns = []
+        simplex_cost = []
+        simplex_upper = []
+        for j in free:
+            simplex_columns.append(dict([(i, signs[i] * value) for i, value in columns[j].items()]))
+            simplex_cost.append(cost[j])
+            simplex_upper.append(float(upper[j] - lower[j]))
+
+        # A row with only an upper bound gets a slack, which starts in the
+        # basis unless the row was negated.  Every other row gets an
+        # artificial variable, driven out in phase one.
+        artificials = []
+        basis = []
+        for i, (rhs, surplus) in enumerate(rows):
+            if surplus is None:
+                simplex_columns.append({i: signs[i]})
+                simplex_cost.append(0.0)
+                simplex_upper.append(INFINITY)
+                if signs[i] > 0:
+                    basis.append(len(simplex_columns) - 1)
+                    continue
+            else:
+                simplex_columns.append({i: -signs[i]})
+                simplex_cost.append(0.0)
+                simplex_upper.append(surplus)
+            artificials.append(len(simplex_columns))
+            basis.append(len(simplex_columns))
+            simplex_columns.append({i: 1.0})
+            simplex_cost.append(0.0)
+            simplex_upper.append(INFINITY)
+
+        simplex = _BoundedSimplex(simplex_columns, simplex_upper, b, basis)
+
+        if artificials:
+            phase_one = [0.0] * len(simplex_columns)
+            for j in artificials:
+                phase_one[j] = 1.0
+            if simplex.solve(phase_one, max_iterations) > EPSILON * max(1.0, sum(b)):
+                reduced = price(simplex._duals(phase_one), [0.0] * n)
+                entering = [j for j in candidates if j not in active and reduced[j] < -EPSILON]
+                if not entering:
+                    return None
+                active.update(entering)
+                continue
+            for j in artificials:
+                simplex.upper[j] = 0.0
+
+        simplex.solve(simplex_cost, max_iterations)
+        reduced = price(simplex._duals(simplex_cost), cost)
+        entering = [j for j in candidates if j not in active and reduced[j] < -EPSILON]
+        if not entering:
+            break
+        active.update(entering)
+
+    simplex_values = simplex.values()
+    values = [float(bound) for bound in lower]
+    for k, j in enumerate(free):
+        values[j] += simplex_values[k]
+    return values, reduced
+
+
+def _fix(objective, values, reduced, best_cost, max_portions):
+    """
+    Reduced cost fixing.  Returns a dict of the foods that no plan cheaper
+    than `best_cost` can move from their limit in the root relaxation, mapped
+    to that limit.
+    """
+    gap = max(best_cost - objective, 0.0) + EPSILON * max(1.0, abs(best_cost))
+    fixed = {}
+    for j, value in enumerate(values):
+        if value < INTEGRALITY and reduced[j] > gap:
+            fixed[j] = 0
+        elif value > max_portions - INTEGRALITY and -reduced[j] > gap:
+            fixed[j] = max_portions
+    return fixed
+
+
+class _BoundedSimplex(object):
+    """
+    Revised simplex for `min c.x` subject to `A x = b`, `0 <= x <= upper`,
+    with `A` given as sparse columns and `basis` a feasible starting basis of
+    identity columns.
+    """
+    def __init__(self, columns, upper, b, basis):
+        self.columns = [column.items() for column in columns]
+        self.upper = upper
+        self.basis = list(basis)
+        self.at_upper = set()
+        m = len(b)
+        self.inverse = [[float(i == k) for k in range(m)] for i in range(m)]
+        self.x_basis = list(b)
+        self._offset = 0
+
+    def _duals(self, cost):
+        m = len(self.basis)
+        duals = [0.0] * m
+        for i in range(m):
+            c = cost[self.basis[i]]
+            if c:
+                row = self.inverse[i]
+                for k in range(m):
+                    duals[k] += c * row[k]
+        return duals
+
+    def solve(self, cost, max_iterations=10000):
+        """
+        Optimizes from the current basis and returns the objective value.
+
+        Raises SolverError if the problem is unbounded or no optimum is found
+        within `max_iterations` pivots.
+        """
+        m = len(self.basis)
+        n = len(self.columns)
+        columns = self.columns
+        upper = self.upper
+        at_upper = self.at_upper
+        inverse = self.inverse
+        x_basis = self.x_basis
+        basic = set(self.basis)
+
+        duals = self._duals(cost)
+        fresh = True
+        degenerate = 0
+
+        for iteration in range(max_iterations):
+            # Fall back to Bland's rule, which cannot cycle, after a run of
+            # degenerate pivots.
+            bland = degenerate >= DEGENERATE_PIVOTS
+
+            # Partial pricing: take the most improving column from the first
+            # block, starting where the last search left off, that has one.
+            # Under Bland's rule take the lowest improving column instead.
+            entering, best, entering_reduced = None, EPSILON, 0.0
+            for scanned in range(n):
+                if bland:
+                    j = scanned
+                else:
+                    j = (self._offset + scanned) % n
+                    if scanned and not scanned % PRICING_BLOCK and entering is not None:
+                        self._offset = j
+                        break
+                if j in basic or not upper[j]:
+                    continue
+                reduced = cost[j]
+                for r, v in columns[j]:
+                    reduced -= duals[r] * v
+                if j in at_upper:
+                    improvement = reduced
+                else:
+                    improvement = -reduced
+                if improvement > best:
+                    entering, best, entering_reduced = j, improvement, reduced
+                    if bland:
+                        break
+            if entering is None:
+                if fresh:
+                    break
+                # Confirm optimality against duals free of accumulated error
+                duals = self._duals(cost)
+                fresh = True
+                continue
+
+            column = columns[entering]
+            direction = [0.0] * m
+            for i in range(m):
+                row = inverse[i]
+                total = 0.0
+                for r, v in column:
+                    total += row[r] * v
+                direction[i] = total
+
+            if entering in at_upper:
+                sign = -1.0
+            else:
+                sign = 1.0
+            step, leaving, leaving_to_upper = upper[entering], None, False
+            for i in range(m):
+                change = sign * direction[i]
+                if change > EPSILON:
+                    ratio = x_basis[i] / change
+                    to_upper = False
+                elif change < -EPSILON and upper[self.basis[i]] < INFINITY:
+                    ratio = (upper[self.basis[i]] - x_basis[i]) / -change
+                    to_upper = True
+                else:
+                    continue
+                if ratio < step or (bland and ratio <= step + EPSILON and leaving is not None and self.basis[i] < self.basis[leaving]):
+                    step, leaving, leaving_to_upper = min(ratio, step), i, to_upper
+            if step == INFINITY:
+                raise SolverError('Problem is unbounded')
+
+            if step > EPSILON:
+                degenerate = 0
+            else:
+                degenerate += 1
+
+            for i in range(m):
+                x_basis[i] -= sign * step * direction[i]
+
+            if leaving is None:
+                # The entering variable moves to its other bound
+                if sign > 0:
+                    at_upper.add(entering)
+                else:
+                    at_upper.discard(entering)
+                continue
+
+            if sign > 0:
+                start = 0.0
+            else:
+                start = upper[entering]
+            departing = self.basis[leaving]
+            if leaving_to_upper:
+                at_upper.add(departing)
+            at_upper.discard(entering)
+            basic.discard(departing)
+            basic.add(entering)
+            self.basis[leaving] = entering
+            x_basis[leaving] = start + sign * step
+
+            # Update the duals and the basis inverse for the new basis
+            pivot = direction[leaving]
+            pivot_row = [value / pivot for value in inverse[leaving]]
+            for k in range(m):
+                duals[k] += entering_reduced * pivot_row[k]
+            fresh = False
+            inverse[leaving] = pivot_row
+            for i in range(m):
+                factor = direction[i]
+                if i != leaving and factor:
+                    row = inverse[i]
+                    for k in range(m):
+                        row[k] -= factor * pivot_row[k]
+        else:
+            raise SolverError('No optimum found within %d iterations' % max_iterations)
+
+        objective = 0.0
+        for i in range(m):
+            objective += cost[self.basis[i]] * x_basis[i]
+        for j in at_upper:
+            objective += cost[j] * upper[j]
+        return objective
+
+    def values(self):
+        values = [0.0] * len(self.columns)
+        for j in self.at_upper:
+            values[j] = self.upper[j]
+        for i, j in enumerate(self.basis):
+            values[j] = self.x_basis[i]
+        return values
@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+class UsdaRouter(object):
+    """
+    Routes reads of `usda` models to `settings.USDA_READ_DATABASE` and writes
+    to `settings.USDA_WRITE_DATABASE`, both defaulting to the default
+    database.
+
+    To use, add 'usda.routers.UsdaRouter' to `DATABASE_ROUTERS`.
+    """
+    def _is_usda(self, model):
+        return model._meta.app_label == 'usda'
+
+    def _read_database(self):
+        return getattr(settings, 'USDA_READ_DATABASE', DEFAULT_DB_ALIAS)
+
+    def _write_database(self):
+        return getattr(settings, 'USDA_WRITE_DATABASE', DEFAULT_DB_ALIAS)
+
+    def db_for_read(self, model, **hints):
+        if self._is_usda(model):
+            return self._read_database()
+        return None
+
+    def db_for_write(self, model, **hints):
+        if self._is_usda(model):
+            # Keep writes related to an existing object, such as many-to-many
+            # additions, on the database that object came from, unless it was
+            # read from the replica.
+            instance = hints.get('instance')
+            if instance is not None and instance._state.db and instance._state.db != self._read_database():
+                return instance._state.db
+            return self._write_database()
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if self._is_usda(obj1) and self._is_usda(obj2):
+            return True
+        return None
+
+    def allow_syncdb(self, db, model):
+        # The replica receives its tables through replication.
+        if self._is_usda(model) and db == self._read_database() and db != self._write_database():
+            return False
+        return None
@@ -0,0 +1,212 @@
+import hashlib
+import itertools
+import logging
+import os
+import sqlite3
+from cStringIO import StringIO
+
+from django.core.management.color import no_style
+from django.db import connections
+
+from usda.cursors import stream_query
+from usda.indexes import create_indexes, drop_indexes
+from usda.models import Food, FoodGroup, Weight, Nutrient, Footnote, \
+                        DataSource, DataDerivation, NutrientData, Source
+
+
+# Number of rows to move between databases at once.
+SNAPSHOT_STEP = 5000
+
+# Suffix appended to the snapshot filename for its checksum file
+CHECKSUM_SUFFIX = '.sha1'
+
+
+def snapshot_models():
+    """
+    Returns all `usda` models in dependency order, including the automatically
+    created `NutrientData.source` through model.
+    """
+    return [
+        FoodGroup,
+        Food,
+        Nutrient,
+        Source,
+        DataDerivation,
+        DataSource,
+        Weight,
+        Footnote,
+        NutrientData,
+        NutrientData._meta.get_field('source').rel.through,
+    ]
+
+
+def checksum(filename):
+    """
+    Returns the SHA-1 hex digest of `filename`.
+    """
+    digest = hashlib.sha1()
+    f = open(filename, 'rb')
+    try:
+        chunk = f.read(65536)
+        while chunk:
+            digest.update(chunk)
+            chunk = f.read(65536)
+    finally:
+        f.close()
+    return digest.hexdigest()
+
+
+def write_checksum(filename):
+    f = open(filename + CHECKSUM_SUFFIX, 'w')
+    try:
+        f.write('%s  %s\n' % (checksum(filename), os.path.basename(filename)))
+    finally:
+        f.close()
+
+
+def verify_checksum(filename):
+    """
+    Returns True if `filename` matches the digest stored alongside it.  An
+    empty checksum file never matches.
+    """
+    f = open(filename + CHECKSUM_SUFFIX, 'r')
+    try:
+        expected = f.read().split()
+    finally:
+        f.close()
+    return bool(expected) and checksum(filename) == expected[0]
+
+
+def _columns(model):
+    return [field.column for field in model._meta.local_fields]
+
+
+def export_snapshot(filename, using):
+    """
+    Copies every `usda` table from the `using` database into a new SQLite
+    database at `filename` and writes its checksum.
+    """
+    if os.path.exists(filename):
+        os.remove(filename)
+
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    snapshot = sqlite3.connect(filename)
+
+    try:
+        for model in snapshot_models():
+            table = model._meta.db_table
+            columns = _columns(model)
+
+            snapshot.execute('CREATE TABLE "%s" (%s)' % (
+                table, ', '.join(['"%s"' % column for column in columns])
+            ))
+            insert = 'INSERT INTO "%s" VALUES (%s)' % (table, ', '.join(['?'] * len(columns)))
+
+            rows = stream_query(using, 'SELECT %s FROM %s ORDER BY %s' % (
+                ', '.join([qn(column) for column in columns]),
+                qn(table), qn(model._meta.pk.column)
+            ), SNAPSHOT_STEP, 'usda_snapshot')
+            total = 0
+            chunk = list(itertools.islice(rows, SNAPSHOT_STEP))
+            while chunk:
+                snapshot.executemany(insert, chunk)
+                total += len(chunk)
+                chunk = list(itertools.islice(rows, SNAPSHOT_STEP))
+
+            logging.info('Exported %d rows from %s' % (total, table))
+
+        snapshot.commit()
+    finally:
+        snapshot.close()
+
+    write_checksum(filename)
+
+
+def _copy_value(value):
+    """
+    Formats `value` for PostgreSQL's `COPY` text format.
+    """
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return value and 't' or 'f'
+    if isinstance(value, float):
+        value = repr(value)
+    elif isinstance(value, unicode):
+        value = value.encode('utf-8')
+    else:
+        value = str(value)
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def import_snapshot(filename, using):
+    """
+    Replaces the contents of every `usda` table in the `using` database with
+    the rows stored in the SQLite snapshot at `filename`.
+
+    On PostgreSQL rows are loaded with `COPY`, because psycopg2 runs
+    `executemany` as one statement per row.  Other backends use
+    `executemany`.
+
+    Callers are responsible for transaction management.
+    """
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    models = snapshot_models()
+    cursor = connection.cursor()
+    copy = connection.settings_dict['ENGINE'].endswith('postgresql_psycopg2')
+
+    for model in reversed(models):
+        cursor.execute('DELETE FROM %s' % qn(model._meta.db_table))
+
+    drop_indexes(using)
+
+    snapshot = sqlite3.connect(filename)
+
+    try:
+        for model in models:
+            table = model._meta.db_table
+            fields = model._meta.local_fields
+
+            insert = 'INSERT INTO %s (%s) VALUES (%s)' % (
+                qn(table),
+                ', '.join([qn(field.column) for field in fields]),
+                ', '.join(['%s'] * len(fields))
+            )
+            copy_sql = 'COPY %s (%s) FROM STDIN' % (
+                qn(table), ', '.join([qn(field.column) for field in fields])
+            )
+
+            source = snapshot.execute('SELECT %s FROM "%s"' % (
+                ', '.join(['"%s"' % field.column for field in fields]), table
+            ))
+            total = 0
+            rows = source.fetchmany(SNAPSHOT_STEP)
+            while rows:
+                # SQLite hands back booleans as integers, so let each field
+                # prepare its own value for the target backend.
+                values = [
+                    [field.get_db_prep_save(field.to_python(value), connection=connection) for field, value in zip(fields, row)]
+                    for row in rows
+                ]
+                if copy:
+                    connection.connection.cursor().copy_expert(copy_sql, StringIO(''.join([
+                        '\t'.join([_copy_value(value) for value in row]) + '\n'
+                        for row in values
+                    ])))
+                else:
+                    cursor.executemany(insert, values)
+                total += len(rows)
+                rows = source.fetchmany(SNAPSHOT_STEP)
+
+            logging.info('Loaded %d rows into %s' % (total, table))
+    finally:
+        snapshot.close()
+
+    # Rows were inserted with explicit primary keys, so bring any sequences
+    # back in line with the data.
+    for sql in connection.ops.sequence_reset_sql(no_style(), models):
+        cursor.execute(sql)
+
+    create_indexes(using)
@@ -0,0 +1,491 @@
+import os
+import random
+import tempfile
+import threading
+import time
+import unittest
+
+from django.conf import settings
+from django.conf.urls.defaults import *
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import CommandError
+from django.db import connection, DEFAULT_DB_ALIAS
+from django.test import TestCase, TransactionTestCase
+
+from usda.daily_values import clear_cache, convert, daily_values, percent_daily_values, \
+                              PROFILE_ADULT, PROFILE_CHILD
+from usda.optimize import DietProblem, SolverError
+from usda.loaders import NutrientLoader
+from usda.indexes import INDEXES, create_indexes, drop_indexes, index_exists
+from usda.routers import UsdaRouter
+from usda.snapshot import export_snapshot, import_snapshot, verify_checksum, CHECKSUM_SUFFIX
+from usda.management.commands.load_usda_snapshot import Command as LoadSnapshotCommand
+from usda.models import Food, FoodGroup, Weight, Nutrient, Footnote, \
+                        DataDerivation, NutrientData, Source, FOOTNOTE_NUTR
+
+
+urlpatterns = patterns('usda.views',
+    url(r'^(?P<ndb_number>\d+)/$', 'food_detail', {'template_name': 'usda/tests/food_detail.html'}, name='usda-food_detail'),
+)
+
+
+class FoodDetailTestCase(TestCase):
+    urls = 'usda.tests'
+
+    def setUp(self):
+        self.food = Food.objects.create(
+            ndb_number=1001,
+            food_group=FoodGroup.objects.create(code=100, description='Dairy and Egg Products'),
+            long_description='Butter, salted',
+        )
+        derivation = DataDerivation.objects.create(code='A', description='Analytical data')
+        sources = [
+            Source.objects.create(code=1, description='Analytical or derived from analytical'),
+            Source.objects.create(code=4, description='Calculated or imputed'),
+        ]
+        for sequence, description, gram_weight in (
+            (1, 'pat (1" sq, 1/3" high)', 5.0),
+            (2, 'tbsp', 14.2),
+            (3, 'cup', 227.0),
+        ):
+            Weight.objects.create(
+                food=self.food, sequence=sequence, amount=1,
+                description=description, gram_weight=gram_weight
+            )
+        for number, units, description in (
+            (203, 'g', 'Protein'),
+            (204, 'g', 'Total lipid (fat)'),
+            (307, 'mg', 'Sodium, Na'),
+        ):
+            nutrient = Nutrient.objects.create(
+                number=number, units=units, description=description,
+                decimals=2, order=number
+            )
+            data = NutrientData.objects.create(
+                food=self.food, nutrient=nutrient, nutrient_value=1.0,
+                data_points=1, data_derivation=derivation
+            )
+            for source in sources:
+                data.source.add(source)
+            Footnote.objects.create(
+                food=self.food, number=1, type=FOOTNOTE_NUTR,
+                nutrient=nutrient, text='Footnote for %s' % description
+            )
+
+    def test_query_count(self):
+        old_debug = settings.DEBUG
+        settings.DEBUG = True
+        try:
+            response = self.client.get('/1001/')
+            queries = len(connection.queries)
+        finally:
+            settings.DEBUG = old_debug
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['object'], self.food)
+        self.assertEqual(len(response.context['weights']), 3)
+        self.assertEqual(len(response.context['nutrient_data'][0].sources), 2)
+        self.assertEqual(queries, 5)
+
+
+class DailyValuesTestCase(TestCase):
+    def setUp(self):
+        clear_cache()
+        self.food = Food.objects.create(
+            ndb_number=1077,
+            food_group=FoodGroup.objects.create(code=100, description='Dairy and Egg Products'),
+            long_description='Milk, whole, 3.25% milkfat',
+        )
+        for number, units, description, value in (
+            (203, 'g', 'Protein', 25.0),
+            (301, 'mg', 'Calcium, Ca', 650.0),
+            (312, u'\xb5g', 'Copper, Cu', 450.0),
+            (418, u'\xb5g', 'Vitamin B-12', 1.2),
+        ):
+            nutrient = Nutrient.objects.create(
+                number=number, units=units, description=description,
+                decimals=2, order=number
+            )
+            NutrientData.objects.create(
+                food=self.food, nutrient=nutrient, nutrient_value=value, data_points=1
+            )
+
+    def tearDown(self):
+        clear_cache()
+
+    def test_convert(self):
+        self.assertAlmostEqual(convert(1.0, 'mg', u'\xb5g'), 1000.0)
+        self.assertAlmostEqual(convert(2400.0, u'\xb5g', 'mg'), 2.4)
+        self.assertAlmostEqual(convert(2.4, 'ug', u'\xb5g'), 2.4)
+        self.assertEqual(convert(5, 'g', 'g'), 5)
+        self.assertRaises(ValueError, convert, 1.0, 'IU', 'mg')
+
+    def test_daily_values_in_stored_units(self):
+        values = daily_values(PROFILE_ADULT)
+        self.assertEqual(sorted(values.keys()), [203, 301, 312, 418])
+        self.assertAlmostEqual(values[301], 1300.0)
+        self.assertAlmostEqual(values[312], 900.0) # 0.9 mg, stored in \xb5g
+        self.assertAlmostEqual(values[418], 2.4)
+
+    def test_profiles(self):
+        self.assertAlmostEqual(daily_values(PROFILE_ADULT)[203], 50.0)
+        self.assertAlmostEqual(daily_values(PROFILE_CHILD)[203], 13.0)
+        self.assertAlmostEqual(daily_values(PROFILE_CHILD)[312], 300.0)
+        self.assertRaises(ValueError, daily_values, 'elderly')
+
+    def test_percent_daily_values(self):
+        numbers, matrix = percent_daily_values(
+            [1077, {self.food: 50}, {1077: 200, 9999: 100}], nutrients=[203, 301, 999]
+        )
+        self.assertEqual(numbers, [203, 301])
+        self.assertEqual(len(matrix), 3)
+        for row, expected in zip(matrix, ([50.0, 50.0], [25.0, 25.0], [100.0, 100.0])):
+            for value, percent in zip(row, expected):
+                self.assertAlmostEqual(value, percent)
+
+        numbers, matrix = percent_daily_values([1077], PROFILE_CHILD, nutrients=[301, 418])
+        self.assertAlmostEqual(matrix[0][0], 650.0 * 100 / 700)
+        self.assertAlmostEqual(matrix[0][1], 1.2 * 100 / 0.9)
+
+    def test_empty_result_not_cached(self):
+        NutrientData.objects.all().delete()
+        Nutrient.objects.all().delete()
+        self.assertEqual(daily_values(PROFILE_ADULT), {})
+
+        Nutrient.objects.create(number=203, units='g', description='Protein', decimals=2, order=600)
+        self.assertEqual(daily_values(PROFILE_ADULT), {203: 50.0})
+
+
+class IndexTestCase(TestCase):
+    def assertIndexes(self, exists):
+        for name, model, field_names in INDEXES:
+            self.assertEqual(index_exists(connection, name, model._meta.db_table), exists)
+
+    def test_created_by_syncdb(self):
+        self.assertIndexes(True)
+
+    def test_drop_and_create_are_idempotent(self):
+        if connection.settings_dict['ENGINE'].endswith('mysql'):
+            return # drop_indexes leaves MySQL indexes alone
+
+        drop_indexes(DEFAULT_DB_ALIAS)
+        drop_indexes(DEFAULT_DB_ALIAS)
+        self.assertIndexes(False)
+
+        create_indexes(DEFAULT_DB_ALIAS)
+        create_indexes(DEFAULT_DB_ALIAS)
+        self.assertIndexes(True)
+
+
+class SnapshotTestCase(TransactionTestCase):
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+
+        self.food = Food.objects.create(
+            ndb_number=1001,
+            food_group=FoodGroup.objects.create(code=100, description='Dairy and Egg Products'),
+            long_description=u'Cr\xe8me fra\xeeche',
+            survey=True,
+        )
+        nutrient = Nutrient.objects.create(
+            number=418, units=u'\xb5g', description='Vitamin B-12',
+            decimals=2, order=9000
+        )
+        data = NutrientData.objects.create(
+            food=self.food, nutrient=nutrient, nutrient_value=0.17,
+            data_points=3, added_nutrient=True
+        )
+        data.source.add(Source.objects.create(code=1, description='Analytical or derived from analytical'))
+
+    def tearDown(self):
+        for filename in (self.filename, self.filename + CHECKSUM_SUFFIX):
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def test_round_trip(self):
+        export_snapshot(self.filename, DEFAULT_DB_ALIAS)
+        self.assertTrue(verify_checksum(self.filename))
+
+        NutrientData.objects.all().delete()
+        Food.objects.update(long_description='Changed', survey=False)
+        import_snapshot(self.filename, DEFAULT_DB_ALIAS)
+
+        food = Food.objects.get(ndb_number=1001)
+        self.assertEqual(food.long_description, u'Cr\xe8me fra\xeeche')
+        self.assertEqual(food.survey, True)
+        data = NutrientData.objects.get(food=food)
+        self.assertEqual(data.nutrient.units, u'\xb5g')
+        self.assertEqual(data.nutrient_value, 0.17)
+        self.assertEqual(data.added_nutrient, True)
+        self.assertEqual(data.standard_error, None)
+        self.assertEqual([source.code for source in data.source.all()], [1])
+
+        # Sequences continue after the loaded rows
+        NutrientData.objects.create(
+            food=food, nutrient=Nutrient.objects.create(number=203, units='g', description='Protein', decimals=2, order=600),
+            nutrient_value=0.85, data_points=1
+        )
+        self.assertEqual(NutrientData.objects.count(), 2)
+
+    def test_load_rejects_checksum_mismatch(self):
+        export_snapshot(self.filename, DEFAULT_DB_ALIAS)
+        f = open(self.filename + CHECKSUM_SUFFIX, 'w')
+        try:
+            f.write('%s  %s\n' % ('0' * 40, os.path.basename(self.filename)))
+        finally:
+            f.close()
+
+        self.assertFalse(verify_checksum(self.filename))
+        self.assertRaises(
+            CommandError, LoadSnapshotCommand().handle,
+            filename=self.filename, database=DEFAULT_DB_ALIAS, verify=True, verbosity=0
+        )
+        self.assertEqual(NutrientData.objects.count(), 1)
+
+
+class UsdaRouterTestCase(TestCase):
+    def setUp(self):
+        self.router = UsdaRouter()
+        self.old_settings = {}
+        for name, value in (('USDA_READ_DATABASE', 'replica'), ('USDA_WRITE_DATABASE', 'primary')):
+            self.old_settings[name] = getattr(settings, name, None)
+            setattr(settings, name, value)
+
+    def tearDown(self):
+        for name, value in self.old_settings.items():
+            if value is None:
+                delattr(settings, name)
+            else:
+                setattr(settings, name, value)
+
+    def test_db_for_read(self):
+        self.assertEqual(self.router.db_for_read(NutrientData), 'replica')
+        self.assertEqual(self.router.db_for_read(ContentType), None)
+
+    def test_db_for_write(self):
+        self.assertEqual(self.router.db_for_write(NutrientData), 'primary')
+        self.assertEqual(self.router.db_for_write(ContentType), None)
+
+    def test_db_for_write_ignores_replica_instance(self):
+        data = NutrientData()
+        data._state.db = 'replica'
+        self.assertEqual(self.router.db_for_write(NutrientData, instance=data), 'primary')
+        self.assertEqual(self.router.db_for_write(Source, instance=data), 'primary')
+
+    def test_db_for_write_follows_other_instance(self):
+        data = NutrientData()
+        data._state.db = 'other'
+        self.assertEqual(self.router.db_for_write(Source, instance=data), 'other')
+
+    def test_allow_syncdb(self):
+        self.assertEqual(self.router.allow_syncdb('replica', NutrientData), False)
+        self.assertEqual(self.router.allow_syncdb('primary', NutrientData), None)
+        self.assertEqual(self.router.allow_syncdb('replica', ContentType), None)
+
+
+class CountingLoader(NutrientLoader):
+    """
+    A NutrientLoader that records its queries instead of reading the
+    database.  Queries block until `proceed` is set.
+    """
+    def __init__(self, *args, **kwargs):
+        super(CountingLoader, self).__init__(*args, **kwargs)
+        self.queries = []
+        self.started = threading.Event()
+        self.proceed = threading.Event()
+        self.proceed.set()
+
+    def _query(self, ndb_numbers):
+        self.queries.append(sorted(ndb_numbers))
+        self.started.set()
+        self.proceed.wait()
+        return dict([(ndb_number, {203: float(ndb_number)}) for ndb_number in ndb_numbers])
+
+
+class NutrientLoaderTestCase(unittest.TestCase):
+    def load_in_thread(self, loader, ndb_numbers):
+        results = {}
+        def load():
+            results.update(loader.load_many(ndb_numbers))
+        thread = threading.Thread(target=load)
+        thread.start()
+        return thread, results
+
+    def test_load_many(self):
+        loader = CountingLoader()
+        self.assertEqual(loader.load_many([1, 2]), {1: {203: 1.0}, 2: {203: 2.0}})
+        self.assertEqual(loader.load(2), {203: 2.0})
+        self.assertEqual(loader.queries, [[1, 2]])
+
+    def test_overlapping_calls_share_query(self):
+        loader = CountingLoader()
+        loader.proceed.clear()
+        first, first_results = self.load_in_thread(loader, [1, 2])
+        loader.started.wait()
+        second, second_results = self.load_in_thread(loader, [2, 1])
+        third, third_results = self.load_in_thread(loader, [2, 3])
+        time.sleep(0.1)
+        loader.proceed.set()
+        for thread in (first, second, third):
+            thread.join()
+
+        self.assertEqual(loader.queries, [[1, 2], [3]])
+        self.assertEqual(first_results, second_results)
+        self.assertEqual(third_results, {2: {203: 2.0}, 3: {203: 3.0}})
+
+    def test_failed_query_releases_waiters(self):
+        loader = CountingLoader()
+        def fail(ndb_numbers):
+            raise ValueError
+        loader._query = fail
+        self.assertRaises(ValueError, loader.load_many, [1])
+        self.assertEqual(loader._in_flight, {})
+
+    def test_expiry(self):
+        loader = CountingLoader(timeout=0)
+        self.assertEqual(loader.load_many([1]), {1: {203: 1.0}})
+
+        loader = CountingLoader(timeout=60)
+        loader.load_many([1])
+        loader.load_many([1])
+        self.assertEqual(loader.queries, [[1]])
+        expires, values = loader._cache[1]
+        loader._cache[1] = (time.time() - 1, values)
+        loader.load_many([1])
+        self.assertEqual(loader.queries, [[1], [1]])
+
+    def test_clear(self):
+        loader = CountingLoader()
+        loader.load_many([1])
+        loader.clear()
+        loader.load_many([1])
+        self.assertEqual(loader.queries, [[1], [1]])
+
+    def test_max_entries(self):
+        loader = CountingLoader(max_entries=2)
+        loader.load_many([1, 2])
+        loader.load_many([3])
+        self.assertEqual(sorted(loader._cache.keys()), [3])
+
+        self.assertEqual(len(loader.load_many([4, 5, 6])), 3)
+        self.assertEqual(sorted(loader._cache.keys()), [4, 5, 6])
+
+
+class MatrixDietProblem(DietProblem):
+    """
+    A DietProblem built from a dict of NDB number to {nutrient number: amount
+    per portion} rather than from the database.
+    """
+    def __init__(self, columns):
+        self.ndb_numbers = sorted(columns.keys())
+        self.nutrients = []
+        for column in columns.values():
+            for nutrient in column:
+                if nutrient not in self.nutrients:
+                    self.nutrients.append(nutrient)
+        self.columns = columns
+        self.portion_descriptions = {}
+
+
+class DietProblemTestCase(unittest.TestCase):
+    def setUp(self):
+        # Minimise 2a + 3b subject to a + b >= 4 and a <= 3
+        self.problem = MatrixDietProblem({
+            1: {1: 1.0, 2: 1.0, 208: 2.0},
+            2: {1: 1.0, 208: 3.0},
+        })
+        self.bounds = {1: (4, None), 2: (None, 3)}
+
+    def test_known_optimum(self):
+        plan = self.problem.solve(self.bounds)
+        self.assertTrue(plan.feasible)
+        self.assertEqual(plan.portions, {1: 3, 2: 1})
+        self.assertEqual(plan.cost, 9.0)
+        self.assertEqual(plan.nutrients[2], 3.0)
+
+    def test_portions_at_upper_limit(self):
+        plan = self.problem.solve(self.bounds, max_portions=2)
+        self.assertTrue(plan.feasible)
+        self.assertEqual(plan.portions, {1: 2, 2: 2})
+        self.assertEqual(plan.cost, 10.0)
+
+    def test_costs(self):
+        plan = self.problem.solve(self.bounds, costs={1: 5.0, 2: 1.0})
+        self.assertEqual(plan.portions, {2: 4})
+        self.assertEqual(plan.cost, 4.0)
+
+    def test_infeasible(self):
+        self.assertFalse(self.problem.solve({1: (100, None)}, max_portions=2).feasible)
+        self.assertFalse(self.problem.solve({1: (5, 4)}).feasible)
+
+    def test_feasible_plan_outside_relaxation(self):
+        # The relaxation uses 1.5 portions of food 0, but neither 1 nor 2
+        # portions of it meet the bounds; one portion of food 2 does.
+        problem = MatrixDietProblem({
+            0: {0: 2.0, 1: 4.0, 208: 1.0},
+            1: {0: 0.0, 1: 1.0, 208: 5.0},
+            2: {0: 3.0, 1: 1.0, 208: 3.0},
+        })
+        plan = problem.solve({0: (3, 8), 1: (1, 6)})
+        self.assertTrue(plan.feasible)
+        self.assertTrue(plan.optimal)
+        self.assertEqual(plan.portions, {2: 1})
+        self.assertEqual(plan.cost, 3.0)
+
+    def test_matches_exhaustive_search(self):
+        r = random.Random(0)
+        for i in range(50):
+            columns = {}
+            for ndb_number in range(3):
+                columns[ndb_number] = dict([(nutrient, r.randint(0, 5)) for nutrient in range(2)])
+                columns[ndb_number][208] = r.randint(1, 6)
+            bounds = dict([
+                (nutrient, (r.choice([None, r.randint(0, 10)]), r.choice([None, r.randint(3, 20)])))
+                for nutrient in range(2)
+            ])
+
+            best = None
+            for portions in [(a, b, c) for a in range(4) for b in range(4) for c in range(4)]:
+                totals = {}
+                for nutrient in (0, 1, 208):
+                    totals[nutrient] = sum([columns[ndb_number][nutrient] * count for ndb_number, count in enumerate(portions)])
+                for nutrient, (lower, upper) in bounds.items():
+                    if (lower is not None and totals[nutrient] < lower) or (upper is not None and totals[nutrient] > upper):
+                        break
+                else:
+                    if best is None or totals[208] < best:
+                        best = totals[208]
+
+            plan = MatrixDietProblem(columns).solve(bounds, max_portions=3)
+            if best is None:
+                self.assertFalse(plan.feasible)
+            else:
+                self.assertTrue(plan.feasible)
+                self.assertEqual(plan.cost, best)
+
+    def test_unknown_nutrient(self):
+        self.assertRaises(ValueError, self.problem.solve, {999: (None, 5)})
+
+    def test_solve_many(self):
+        plans = self.problem.solve_many([self.bounds, ({1: (2, None)}, {1: 1.0, 2: 1.0})])
+        self.assertEqual(len(plans), 2)
+        self.assertEqual(plans[0].cost, 9.0)
+        self.assertEqual(plans[1].cost, 2.0)
+
+    def test_iteration_limit(self):
+        r = random.Random(0)
+        columns = {}
+        for ndb_number in range(200):
+            columns[ndb_number] = dict([(nutrient, r.random()) for nutrient in range(40)])
+            columns[ndb_number][208] = 1 + r.random()
+        problem = MatrixDietProblem(columns)
+        bounds = dict([(nutrient, (5, 20)) for nutrient in range(40)])
+        self.assertRaises(SolverError, problem.solve, bounds, max_iterations=3)
+        self.assertTrue(problem.solve(bounds).feasible)
+
+    def test_node_limit(self):
+        plan = self.problem.solve({1: (4.5, None), 2: (None, 3)}, max_nodes=1)
+        self.assertTrue(plan.feasible)
+        self.assertFalse(plan.optimal)
+        self.assertTrue(self.problem.solve({1: (4.5, None), 2: (None, 3)}).optimal)
@@ -1,6 +1,15 @@
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.shortcuts import get_object_or_404, render_to_response
+from django.template import RequestContext
+from django.utils import simplejson
 from django.views.generic import list_detail
 
-from usda.models import Food
+from usda.loaders import NutrientLoader
+from usda.models import Food, NutrientData
+
+
+# Shared by all requests handled by this process
+nutrient_loader = NutrientLoader()
 
 
 def food_list(request, template_name='usda/food_list.html'):
@@ -12,9 +21,42 @@ def food_list(request, template_name='usda/food_list.html'):
 
 
 def food_detail(request, ndb_number, template_name='usda/food_detail.html'):
-    return list_detail.object_detail(
-        request, Food.objects.all(),
-        object_id=ndb_number,
-        template_name=template_name,
-        template_object_name='food',
-    )
\ No newline at end of file
+    """
+    Displays a single food along with its weights, footnotes and nutrient data.
+
+    Related records are fetched up front, in a fixed number of queries, rather
+    than through the related managers from within the template.
+    """
+    food = get_object_or_404(Food.objects.select_related('food_group'), ndb_number=ndb_number)
+
+    weights = list(food.weight_set.order_by('sequence'))
+    footnotes = list(food.footnote_set.select_related('nutrient'))
+    nutrient_data = list(food.nutrientdata_set.select_related('nutrient', 'data_derivation'))
+
+    sources = {}
+    for link in NutrientData.source.through.objects.filter(nutrientdata__food=food).select_related('source'):
+        sources.setdefault(link.nutrientdata_id, []).append(link.source)
+    for data in nutrient_data:
+        data.sources = sources.get(data.pk, [])
+
+    return render_to_response(template_name, {
+        'object': food,
+        'food': food,
+        'weights': weights,
+        'footnotes': footnotes,
+        'nutrient_data': nutrient_data,
+    }, context_instance=RequestContext(request))
+
+
+def food_nutrients(request):
+    """
+    Returns the nutrient values, per 100 grams, of every food given as an
+    `ndb_number` query parameter as a JSON object keyed by NDB number.
+    """
+    try:
+        ndb_numbers = [int(ndb_number) for ndb_number in request.GET.getlist('ndb_number')]
+    except ValueError:
+        return HttpResponseBadRequest('ndb_number must be an integer')
+
+    data = nutrient_loader.load_many(ndb_numbers)
+    return HttpResponse(simplejson.dumps(data), mimetype='application/json')